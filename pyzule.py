@@ -1,16 +1,25 @@
 #!/usr/bin/env python3
 import os
 import sys
+import json
+import zlib
+import struct
+import asyncio
 import argparse
 from PIL import Image
+from copy import copy
 from glob import glob
 from time import time
+from hashlib import sha256
 from atexit import register
+from fnmatch import fnmatch
+from contextlib import contextmanager
 from platform import system
 from plistlib import load, dump
-from zipfile import ZipFile, BadZipFile
+from concurrent.futures import ThreadPoolExecutor
 from shutil import rmtree, copyfile, copytree, move
-from subprocess import run, DEVNULL, CalledProcessError
+from subprocess import run, PIPE, DEVNULL, CalledProcessError
+from zipfile import ZipFile, ZipInfo, BadZipFile, ZIP_DEFLATED
 WORKING_DIR = os.getcwd()
 USER_DIR = os.path.expanduser("~/.zxcvbn")
 changed = 0
@@ -38,6 +47,13 @@ parser.add_argument("-c", metavar="level", type=int, default=6,
                     help="the compression level of the output ipa (default is 6)",
                     action="store", choices=range(1, 10),
                     nargs="?", const=1)
+parser.add_argument("-j", metavar="jobs", type=int, default=os.cpu_count() or 1,
+                    help="how many commands, files being compressed, and other file operations can each run at the same time (default is the number of cpus)")
+parser.add_argument("-g", metavar="megabytes", type=int, default=512,
+                    help="how much memory compression can use at once (default is 512)")
+parser.add_argument("-a", metavar="gigabytes", type=int,
+                    help="cache the extracted ipa to patch it faster next time, keeping at most this many gigabytes of cached ipas (default is 10)",
+                    action="store", nargs="?", const=10)
 parser.add_argument("-k", metavar="icon", type=str, required=False,
                     help="an image file to use as the app icon")
 parser.add_argument("-x", metavar="entitlements", type=str, required=False,
@@ -64,6 +80,10 @@ parser.add_argument("-t", action="store_true",
                     help="use substitute instead of substrate")
 parser.add_argument("-z", action="store_true",
                     help="use 7zip instead of zip")
+parser.add_argument("-q", action="store_true",
+                    help="quickly re-patch an ipa/app that was patched by pyzule. only tweaks given with -f or -y are changed, all others are kept")
+parser.add_argument("-y", metavar="tweaks", nargs="+", type=str,
+                    help="tweaks to remove when re-patching with -q (the names they were injected with)")
 args = parser.parse_args()
 
 # sanitize paths
@@ -75,12 +95,20 @@ if not args.i.endswith(".ipa") and not args.i.endswith(".app"):
     parser.error("the input file must be an ipa/app")
 elif not os.path.exists(args.i):
     parser.error(f"{args.i} does not exist")
-elif not any((args.f, args.u, args.w, args.m, args.d, args.n, args.v, args.b, args.s, args.e, args.r, args.k, args.x, args.l)):
+elif not any((args.f, args.u, args.w, args.m, args.d, args.n, args.v, args.b, args.s, args.e, args.r, args.k, args.x, args.l, args.y)):
     parser.error("at least one option to modify the ipa must be present")
 elif args.p and args.t:
     # well, you know, you CAN, but i just dont wanna implement that.
     # i would remove -p altogether but i already spent a considerable amount of time on it.
     parser.error("sorry, you can't use substitute while injecting into @executable_path")
+elif args.j < 1:
+    parser.error("at least 1 job is needed")
+elif args.g < 1:
+    parser.error("compression needs at least 1 megabyte of memory")
+elif args.a is not None and args.a < 1:
+    parser.error("the cache needs at least 1 gigabyte")
+elif args.y and not args.q:
+    parser.error("tweaks can only be removed when re-patching with -q")
 elif args.m:
     for char in args.m:
         if char not in ("0", "1", "2", "3", "4", "5", "6", "7", "8", "9", "."):
@@ -105,6 +133,11 @@ if os.path.exists(args.o):
         sys.exit()
 EXTRACT_DIR = f".pyzule-{time()}"
 REAL_EXTRACT_DIR = os.path.join(os.getcwd(), EXTRACT_DIR)
+CACHE_DIR = os.path.join(USER_DIR, "cache")
+CACHE_TMP = os.path.join(CACHE_DIR, EXTRACT_DIR)  # has to be on the same filesystem as the cache so it can be renamed into it
+
+if args.a and not args.i.endswith(".ipa"):
+    print("[?] only ipas can be cached, -a will be ignored")
 
 if args.f:
     if (nonexistant := ", ".join(ne for ne in args.f if not os.path.exists(ne))):
@@ -116,16 +149,41 @@ if args.f:
         sys.exit(1)
 
     if args.p:
-        inject_path = ""
-        inject_path_exec = "@executable_path"
         print("[*] will inject into @executable_path")
-    else:
-        inject_path = "Frameworks"
-        inject_path_exec = "@rpath"
-
     if args.t:
         print("[*] will use substitute instead of substrate")
 
+if args.p:
+    inject_path = ""
+    inject_path_exec = "@executable_path"
+else:
+    inject_path = "Frameworks"
+    inject_path_exec = "@rpath"
+
+args.f = [os.path.normpath(np) for np in args.f or ()]
+DYLIBS_PATH = os.path.join(REAL_EXTRACT_DIR, "pyzule-inject")  # we'll copy everything we modify (dylibs) here to not mess with the original files
+common = (
+    "libmryipc.dylib", "librocketboostrap.dylib", "cydiasubstrate.framework",
+    "cephei.framework", "cepheiui.framework", "cepheiprefs.framework",
+    "substitute.framework", "libhdev.framework"
+)
+dylibs = {d for d in args.f if d.endswith(".dylib") and not any(com in d.lower() for com in common)}
+id_injected = {f for f in args.f if ".framework" in f and not any(com in f.lower() for com in common)}
+id_injected.update(dylibs)
+needed = set()
+deps_info = {
+    "substrate.": "CydiaSubstrate.framework/CydiaSubstrate",
+    "librocketbootstrap.": "librocketbootstrap.dylib",
+    "libmryipc.": "libmryipc.dylib",
+    "cephei.": "Cephei.framework/Cephei",
+    "cepheiui.": "CepheiUI.framework/CepheiUI",
+    "cepheiprefs.": "CepheiPrefs.framework/CepheiPrefs",
+    "libhdev.": "libhdev.framework/libhdev"
+}
+
+if args.t:
+    deps_info["substrate."] = "Substitute.framework/Substitute"
+
 if not args.o.endswith(".app") and args.z:
     if args.c != 6:
         print("[!] compression level will be ignored when using 7z")
@@ -188,105 +246,697 @@ def remove_dirs(app_path, removed, *names):
 def cleanup():
     print("[*] deleting temporary directory..")
     rmtree(REAL_EXTRACT_DIR)
+    if args.a:
+        rmtree(CACHE_TMP, ignore_errors=True)
 
 
-# extracting ipa/copying app
+# everything from here on is split into stages. a stage only starts once the stages it
+# depends on are done, so independent work (like extracting the ipa and preparing tweaks,
+# or compressing assets while binaries are being modified) happens at the same time.
+STAGES = {}
+POOL = ThreadPoolExecutor(max_workers=args.j)
+COMPRESSOR = ThreadPoolExecutor(max_workers=args.j)  # separate, so compressing assets never holds up patching
+WRITER = ThreadPoolExecutor(max_workers=1)  # entries can only be written to the ipa one at a time
 INPUT_IS_IPA = 1 if args.i.endswith(".ipa") else 0
 OUTPUT_IS_IPA = 1 if args.o.endswith(".ipa") else 0
-if INPUT_IS_IPA:
-    print("[*] extracting ipa..")
-    try:
-        os.makedirs(EXTRACT_DIR)
-        with ZipFile(args.i, "r") as ipa:
-            if not any(name.startswith("Payload/") for name in ipa.namelist()):
-                raise KeyError
-            ipa.extractall(path=EXTRACT_DIR)
-    except KeyError:
-        print("[!] couldn't find Payload folder, invalid ipa")
-        sys.exit(1)
-    except BadZipFile:
-        print("[!] not a zip/ipa file")
-        sys.exit(1)
-    print("[*] extracted ipa")
+INPUT_BASENAME = os.path.basename(args.i)
+OUTPUT_ZIP = os.path.join(EXTRACT_DIR, os.path.basename(args.o))
+INJECTED = {os.path.basename(f) for f in args.f or ()}
+WRITTEN = {}  # arcname -> (size, mtime, inode) of everything already in the output ipa
+INPUT_SHA = None
+
+# with -q, only what's going to change is extracted from the input ipa. everything
+# else is copied into the output ipa as it is, without compressing it again
+INCREMENTAL = 1 if args.q and INPUT_IS_IPA and OUTPUT_IS_IPA and not args.z else 0
+INPUT_ZIP = None
+EXTRACTED = set()  # arcnames that were extracted (or are being replaced), so what's on disk is used for them
+
+# records what was patched into the app, so -q can later change only what's different
+MANIFEST = ".pyzule.json"
+manifest = {"tweaks": {}}
+old_manifest = None
+origins = {}  # name of everything we inject -> name of the tweak it came from
+touched = set()  # everything injected (or removed) during this run
+hashing = []  # (items, item, task) of manifest hashes that are still being computed
+HAS_ENTITLEMENTS = None  # stays None until the binary is about to be modified
+
+# anything in here might still be modified after extracting, so it's compressed last
+VOLATILE = (
+    "Info.plist", "Frameworks", "PlugIns", "Extensions", "Watch", "WatchKit",
+    "com.apple.WatchPlaceholder", "pyzule.entitlements", MANIFEST
+)
+
+
+def stage(*deps):
+    def add_stage(func):
+        STAGES[func.__name__] = (func, deps)
+        return func
+    return add_stage
+
+
+async def run_stages():
+    tasks = {}
+
+    async def run_stage(name):
+        func, deps = STAGES[name]
+        if deps:
+            await asyncio.wait([tasks[dep] for dep in deps])  # unlike gather, this won't cancel deps if we're cancelled
+        try:
+            await func()
+        except (Exception, SystemExit) as e:  # skipcq: PYL-W0703
+            # asyncio doesn't like tasks calling sys.exit(), so every error (exits included)
+            # stops all other stages and gets raised once we're out of the event loop
+            for task in tasks.values():
+                if task is not asyncio.current_task():
+                    task.cancel()
+            return e
+        return None
+
+    for name in STAGES:
+        tasks[name] = asyncio.create_task(run_stage(name))
+    for result in await asyncio.gather(*tasks.values(), return_exceptions=True):
+        if isinstance(result, (Exception, SystemExit)):
+            return result
+    return None
+
+
+async def sh(cmd, check=True, stdout=None, stderr=None, capture=False, cwd=None):
+    async with LIMITER:
+        if capture:
+            stdout = PIPE
+        if isinstance(cmd, str):
+            proc = await asyncio.create_subprocess_shell(cmd, stdout=stdout, stderr=stderr, cwd=cwd)
+        else:
+            proc = await asyncio.create_subprocess_exec(*cmd, stdout=stdout, stderr=stderr, cwd=cwd)
+        out, _ = await proc.communicate()
+    if check and proc.returncode:
+        raise CalledProcessError(proc.returncode, cmd, out)
+    return out.decode() if capture else proc.returncode
+
+
+async def offload(func, *func_args):
+    return await asyncio.get_running_loop().run_in_executor(POOL, func, *func_args)
+
 
-# checking ipa/app validity
-try:
-    INPUT_BASENAME = os.path.basename(args.i)
+def is_asset(path):
+    top = os.path.relpath(path, APP_PATH).split(os.sep)[0]
+    return not (
+        top in VOLATILE or top == BINARY or top in INJECTED
+        or top.endswith((".dylib", ".framework", ".appex"))
+    )
+
+
+def payload_entries():
     if INPUT_IS_IPA:
-        APP_PATH = glob(os.path.join(EXTRACT_DIR, "Payload", "*.app"))[0]
-    else:
-        print("[*] copying app to temporary directory..")
-        copytree(args.i, os.path.join(EXTRACT_DIR, INPUT_BASENAME))
-        print("[*] copied app")
-        APP_PATH = glob(os.path.join(EXTRACT_DIR, INPUT_BASENAME))[0]
-    PLIST_PATH = glob(os.path.join(APP_PATH, "Info.plist"))[0]
-    BINARY = get_plist(PLIST_PATH, "CFBundleExecutable")
-    if system == "Linux":
-        BINARY_PATH = os.path.join(APP_PATH, BINARY)
+        root, arc_root = os.path.join(EXTRACT_DIR, "Payload"), "Payload"
+        dirs = [(root, arc_root)]
     else:
-        BINARY_PATH = os.path.join(APP_PATH, BINARY).replace(" ", r"\ ")
-
-    # checking encryption status
-    if any("cryptid 1" in line for line in str(run(f"otool -l '{BINARY_PATH}'", capture_output=True, check=True, shell=True)).split("\\n")):
-        print("[?] app is encrypted, the output app will only work for devices that have ever been logged in to your apple id")
-        print("[?] find a decrypted ipa for everything to function normally")
-except IndexError:
-    print("[!] couldn't find .app folder and/or Info.plist file, invalid ipa/app specified")
-    sys.exit(1)
+        root, arc_root = APP_PATH, os.path.join("Payload", INPUT_BASENAME)
+        dirs = [(EXTRACT_DIR, "Payload"), (root, arc_root)]
+    files = []
 
-# remove app extensions
-if args.e:
-    remove_dirs(APP_PATH, "app extensions", "PlugIns", "Extensions")
+    for dirpath, dirnames, filenames in os.walk(root):
+        arc_dir = os.path.normpath(os.path.join(arc_root, os.path.relpath(dirpath, root)))
+        dirs.extend((os.path.join(dirpath, d), os.path.join(arc_dir, d)) for d in dirnames)
+        files.extend((os.path.join(dirpath, f), os.path.join(arc_dir, f)) for f in filenames)
+    return dirs, files
+
+
+def arcname_of(path):
+    return os.path.relpath(path, EXTRACT_DIR).replace(os.sep, "/")
+
+
+def is_extracted(arcname):
+    return any(arcname == e or arcname.startswith(f"{e}/") for e in EXTRACTED)
+
+
+def input_entries(arcname):
+    # entries of the input ipa at (or inside) arcname that haven't been extracted
+    return [
+        info for info in INPUT_ZIP.infolist()
+        if ((name := info.filename.rstrip("/")) == arcname or name.startswith(f"{arcname}/")) and not is_extracted(name)
+    ]
+
+
+def input_glob(pattern):
+    # glob(), but for what's still only in the input ipa
+    if not INCREMENTAL:
+        return []
+    parts = pattern.split(os.sep)
+    root = arcname_of(APP_PATH)
+    found = set()
+    for info in INPUT_ZIP.infolist():
+        if not info.filename.startswith(f"{root}/"):
+            continue
+        rel = info.filename[len(root) + 1:].rstrip("/").split("/")
+        if len(rel) >= len(parts) and all(fnmatch(r, p) for r, p in zip(rel, parts)):
+            found.add(os.path.join(APP_PATH, *rel[:len(parts)]))
+    return sorted(f for f in found if not is_extracted(arcname_of(f)))
+
+
+def is_present(path):
+    return os.path.lexists(path) or (INCREMENTAL and bool(input_entries(arcname_of(path))))
+
+
+async def extract_item(path, keep=True):
+    # with -q, anything has to be extracted before it's changed. if it's about to be
+    # replaced or removed anyway (keep=False), only an empty placeholder is made for it
+    if not INCREMENTAL or is_extracted(arcname := arcname_of(path)):
+        return
+    entries = input_entries(arcname)
+    EXTRACTED.add(arcname)
+    if keep:
+        await offload(INPUT_ZIP.extractall, EXTRACT_DIR, entries)
+    elif any(info.filename == arcname for info in entries):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        open(path, "wb").close()
+    elif entries:
+        os.makedirs(path, exist_ok=True)
+
+
+def compress_entry(path, arcname):
+    zinfo = ZipInfo.from_file(path, arcname, strict_timestamps=False)
+    zinfo.compress_type = ZIP_DEFLATED
+    with open(path, "rb") as f:
+        data = f.read()
+    zinfo.file_size = len(data)
+    zinfo.CRC = zlib.crc32(data)
+    compressor = zlib.compressobj(args.c, zlib.DEFLATED, -15)
+    data = compressor.compress(data) + compressor.flush()
+    zinfo.compress_size = len(data)
+    return zinfo, data
+
+
+def compress_large_entry(path, arcname, spool_path, chunk_size):
+    # too big to keep in memory, so it's compressed a chunk at a time into a spool file
+    zinfo = ZipInfo.from_file(path, arcname, strict_timestamps=False)
+    zinfo.compress_type = ZIP_DEFLATED
+    zinfo.file_size = zinfo.compress_size = zinfo.CRC = 0
+    compressor = zlib.compressobj(args.c, zlib.DEFLATED, -15)
+    with open(path, "rb") as f, open(spool_path, "wb") as spool:
+        while data := f.read(chunk_size):
+            zinfo.file_size += len(data)
+            zinfo.CRC = zlib.crc32(data, zinfo.CRC)
+            zinfo.compress_size += spool.write(compressor.compress(data))
+        zinfo.compress_size += spool.write(compressor.flush())
+    return zinfo
+
+
+def write_spooled_entry(zf, zinfo, spool_path):
+    with open(spool_path, "rb") as spool:
+        write_entry(zf, zinfo, iter(lambda: spool.read(1024 * 1024), b""))
+    os.remove(spool_path)
+
+
+def write_entry(zf, zinfo, chunks):
+    # zipfile can't take data that was already compressed, so the entry is written by hand.
+    # start_dir has to be kept up to date, since that's where zipfile continues writing.
+    zf.fp.seek(zf.start_dir)
+    zinfo.header_offset = zf.fp.tell()
+    zf.fp.write(zinfo.FileHeader())
+    for chunk in chunks:
+        zf.fp.write(chunk)
+    zf.start_dir = zf.fp.tell()
+    zf.filelist.append(zinfo)
+    zf.NameToInfo[zinfo.filename] = zinfo
+
+
+def copy_entries(zf, infos):
+    # these entries are the same as in the input ipa, so their compressed data is copied over as it is
+    with open(args.i, "rb") as src:
+        for info in infos:
+            src.seek(info.header_offset + 26)
+            name_len, extra_len = struct.unpack("<HH", src.read(4))
+            src.seek(info.header_offset + 30 + name_len + extra_len)
+            zinfo = copy(info)
+            zinfo.flag_bits &= ~0x08  # sizes go in the local header instead of a data descriptor after the data
+            zinfo.extra = b""
+
+            def chunks(left=info.compress_size):
+                while left:
+                    if not (chunk := src.read(min(left, 1024 * 1024))):
+                        raise BadZipFile(f"{info.filename} is truncated")
+                    left -= len(chunk)
+                    yield chunk
+
+            write_entry(zf, zinfo, chunks())
+
+
+async def compress_files(entries):
+    loop = asyncio.get_running_loop()
+    limit = args.g * 1024 * 1024
+    chunk_size = max(min(limit // (2 * args.j), 16 * 1024 * 1024), 1)
+    spool_dir = os.path.join(REAL_EXTRACT_DIR, "pyzule-spool")
+    os.makedirs(spool_dir, exist_ok=True)
+    in_use = 0
+    freed = asyncio.Condition()
+
+    async def compress_file(path, arcname):
+        nonlocal in_use
+        try:
+            st = os.stat(path)
+            # both the file and its compressed data are in memory at once
+            needed = 2 * min(st.st_size, chunk_size)
+            async with freed:
+                await freed.wait_for(lambda: in_use + needed <= limit)
+                in_use += needed
+            try:
+                if st.st_size > chunk_size:
+                    spool_path = os.path.join(spool_dir, sha256(arcname.encode()).hexdigest())
+                    zinfo = await loop.run_in_executor(COMPRESSOR, compress_large_entry, path, arcname, spool_path, chunk_size)
+                else:
+                    zinfo, data = await loop.run_in_executor(COMPRESSOR, compress_entry, path, arcname)
+            finally:
+                async with freed:
+                    in_use -= needed
+                    freed.notify_all()
+            # the writer only ever gets finished entries, so it never waits on compression
+            if st.st_size > chunk_size:
+                await loop.run_in_executor(WRITER, write_spooled_entry, ZIP, zinfo, spool_path)
+            else:
+                await loop.run_in_executor(WRITER, write_entry, ZIP, zinfo, (data,))
+        except FileNotFoundError:
+            return  # removed while we were waiting, writing the rest of the ipa takes care of it
+        WRITTEN[arcname] = (st.st_size, st.st_mtime_ns, st.st_ino)
+
+    await asyncio.gather(*(compress_file(path, arcname) for path, arcname in entries))
+
+
+def hash_file(path):
+    sha = sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(1024 * 1024):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def hash_path(path):
+    if not os.path.isdir(path):
+        return hash_file(path)
+    sha = sha256()
+    for dirpath, dirnames, filenames in os.walk(path):
+        dirnames.sort()
+        for filename in sorted(filenames):
+            full_path = os.path.join(dirpath, filename)
+            sha.update(os.path.relpath(full_path, path).encode())
+            sha.update((os.readlink(full_path) if os.path.islink(full_path) else hash_file(full_path)).encode())
+    return sha.hexdigest()
+
+
+def dir_size(path):
+    return sum(
+        os.path.getsize(os.path.join(dirpath, f))
+        for dirpath, _, filenames in os.walk(path) for f in filenames
+        if not os.path.islink(os.path.join(dirpath, f))
+    )
+
+
+@contextmanager
+def cache_index():
+    from fcntl import flock, LOCK_EX  # skipcq: PYL-C0415 -- doesn't exist on windows
+
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    index_path = os.path.join(CACHE_DIR, "index.json")
+    with open(os.path.join(CACHE_DIR, ".lock"), "w") as lock:
+        flock(lock, LOCK_EX)  # other pyzule runs wait here until we close the lock file
+        try:
+            with open(index_path) as f:
+                index = json.load(f)
+        except (FileNotFoundError, ValueError):
+            index = {}
+        yield index
+        with open(f"{index_path}.tmp", "w") as f:
+            json.dump(index, f, indent=2)
+        os.replace(f"{index_path}.tmp", index_path)
+
+
+def lock_entry(path, exclusive=False):
+    # runs using a cached ipa hold a shared lock on it, so it can only be removed once nobody is using it.
+    # returns None if the entry doesn't exist or someone else holds a conflicting lock
+    from fcntl import flock, LOCK_SH, LOCK_EX, LOCK_NB  # skipcq: PYL-C0415 -- doesn't exist on windows
 
-# injecting stuff
-if args.f:
-    ENT_PATH = os.path.join(APP_PATH, 'pyzule.entitlements')
     try:
-        run(f"ldid -e {BINARY_PATH} > {ENT_PATH}", shell=True, check=True, stderr=DEVNULL)
-        HAS_ENTITLEMENTS = 1 if os.path.getsize(ENT_PATH) > 0 else 0
+        lock = open(os.path.join(path, ".lock"), "a")
+    except (FileNotFoundError, NotADirectoryError):
+        return None
+    try:
+        flock(lock, (LOCK_EX if exclusive else LOCK_SH) | LOCK_NB)
+    except BlockingIOError:
+        lock.close()
+        return None
+    return lock
+
+
+def remove_entries(entries):
+    for path, lock in entries:
+        rmtree(path, ignore_errors=True)
+        lock.close()
+
+
+async def clone_tree(src, dst):
+    # copy-on-write when the filesystem supports it, so every run gets its own copy for (almost) free
+    if system == "Darwin":
+        cmd = ["cp", "-c", "-R", "-p", src, dst]
+    else:
+        cmd = ["cp", "-R", "-p", "--reflink=auto", src, dst]
+    try:
+        await sh(cmd, stderr=DEVNULL)
     except CalledProcessError:
-        with open(ENT_PATH, "w") as epf:
-            HAS_ENTITLEMENTS = 0
-        del epf
+        rmtree(dst, ignore_errors=True)
+        await offload(copytree, src, dst)
+
+
+async def extract_cached(ipa):
+    from fcntl import flock, LOCK_SH  # skipcq: PYL-C0415 -- doesn't exist on windows
+    global INPUT_SHA  # skipcq: PYL-W0603
+    st = os.stat(args.i)
+    leftovers = []
+    with cache_index() as index:
+        # a cached ipa with the same size means it's worth hashing this one before extracting it
+        # (a copied or re-downloaded ipa has a different mtime). the hash decides if it's the same
+        hinted = any(e["size"] == st.st_size for e in index.values())
+
+        # anything left behind by runs that crashed isn't locked anymore
+        for path in glob(os.path.join(CACHE_DIR, ".pyzule-*")) + glob(os.path.join(CACHE_DIR, ".evicted-*")):
+            if (lock := lock_entry(path, exclusive=True)) is not None:
+                leftovers.append((path, lock))
+    await offload(remove_entries, leftovers)
+
+    sha = await offload(hash_file, args.i) if hinted else None
+    lock = None
+    if sha:
+        with cache_index():
+            lock = lock_entry(os.path.join(CACHE_DIR, sha))
+
+    if lock is not None:
+        print("[*] found ipa in cache")
+        source = os.path.join(CACHE_DIR, sha)
+    else:
+        print("[*] extracting ipa..")
+        with cache_index():
+            os.makedirs(CACHE_TMP)
+            lock = lock_entry(CACHE_TMP, exclusive=True)
+        if sha:
+            await offload(ipa.extractall, CACHE_TMP)
+        else:
+            sha, _ = await asyncio.gather(offload(hash_file, args.i), offload(ipa.extractall, CACHE_TMP))
+        source = CACHE_TMP
+        with cache_index():
+            try:
+                os.rename(CACHE_TMP, os.path.join(CACHE_DIR, sha))
+                source = os.path.join(CACHE_DIR, sha)
+                flock(lock, LOCK_SH)  # the lock moved with the directory, and only has to be shared now
+            except OSError:
+                pass  # another run cached the same ipa first, so ours is just used once and deleted
+        print("[*] extracted ipa")
+
+    INPUT_SHA = sha
+    cached_path = os.path.join(CACHE_DIR, sha)
+    try:
+        await clone_tree(os.path.join(source, "Payload"), os.path.join(EXTRACT_DIR, "Payload"))
     finally:
-        run(f"ldid -S {BINARY_PATH}", shell=True, check=True)
-    DYLIBS_PATH = os.path.join(REAL_EXTRACT_DIR, "pyzule-inject")
-    os.makedirs(DYLIBS_PATH, exist_ok=True)  # we'll copy everything we modify (dylibs) here to not mess with the original files
+        lock.close()
+
+    with cache_index() as index:
+        size = index.get(sha, {}).get("bytes")
+    if size is None:
+        size = await offload(dir_size, cached_path)
+
+    # evict the least recently used ipas until everything fits in the limit
+    limit = args.a * 1024 ** 3
+    evicted = []
+    with cache_index() as index:
+        if os.path.isdir(cached_path):
+            index[sha] = {"size": st.st_size, "mtime": st.st_mtime_ns, "bytes": size, "used": time()}
+        total = sum(e["bytes"] for e in index.values())
+        for old in [sha] if size > limit else sorted(index, key=lambda old: index[old]["used"]):
+            if size <= limit and total <= limit:
+                break
+            old_path = os.path.join(CACHE_DIR, old)
+            if (old_lock := lock_entry(old_path, exclusive=True)) is None:
+                if os.path.isdir(old_path):
+                    continue  # another run is still using it
+            total -= index.pop(old)["bytes"]
+            if old_lock is not None:
+                # renamed first so nothing tries to use it while it's being deleted
+                os.rename(old_path, evicted_path := os.path.join(CACHE_DIR, f".evicted-{old}-{time()}"))
+                evicted.append((evicted_path, old_lock))
+    await offload(remove_entries, evicted)
+    if size > limit:
+        print(f"[?] ipa is bigger than {args.a}GB, so it wasn't cached")
+    elif evicted:
+        print(f"[*] removed {len(evicted)} old ipa(s) from cache")
+
+
+def read_manifest():
+    found = None
+    try:
+        if INPUT_IS_IPA:
+            with ZipFile(args.i, "r") as ipa:
+                for name in ipa.namelist():
+                    if name.startswith("Payload/") and name.endswith(f".app/{MANIFEST}") and name.count("/") == 2:
+                        found = json.loads(ipa.read(name))
+                        break
+        else:
+            with open(os.path.join(args.i, MANIFEST)) as f:
+                found = json.load(f)
+    except (BadZipFile, FileNotFoundError, ValueError):
+        return None
 
-    args.f = [os.path.normpath(np) for np in args.f]
+    # anything that doesn't look like what write_manifest() makes is treated as missing
+    try:
+        valid = (
+            all(key in found for key in ("input", "options", "tweaks", "dependencies"))
+            and all(opt in found["options"] for opt in ("p", "t", "s"))
+            and all(
+                isinstance(tweak["items"], dict) and isinstance(tweak["load_commands"], list) and "sha256" in tweak
+                for tweak in found["tweaks"].values()
+            )
+        )
+    except (KeyError, TypeError, AttributeError):
+        valid = False
+    return found if valid else None
+
+
+def remove_load_commands(binary, names):
+    # insert_dylib can only add load commands, so removing them is done by hand: matching
+    # dylib commands are cut out of every slice and the ones after them are moved up
+    dylib_cmds = (0xc, 0x80000018, 0x8000001f, 0x20, 0x80000023)  # LC_LOAD_DYLIB, LC_LOAD_WEAK_DYLIB, LC_REEXPORT_DYLIB, LC_LAZY_LOAD_DYLIB, LC_LOAD_UPWARD_DYLIB
+    with open(binary, "rb") as f:
+        data = bytearray(f.read())
+
+    slices = [0]
+    if (magic := struct.unpack_from(">I", data)[0]) in (0xcafebabe, 0xcafebabf):  # fat binary
+        fmt = ">iiIII" if magic == 0xcafebabe else ">iiQQII"
+        slices = [struct.unpack_from(fmt, data, 8 + i * struct.calcsize(fmt))[2] for i in range(struct.unpack_from(">I", data, 4)[0])]
+
+    for offset in slices:
+        magic, _, _, _, ncmds, sizeofcmds = struct.unpack_from("<6I", data, offset)
+        if magic not in (0xfeedface, 0xfeedfacf):  # MH_MAGIC, MH_MAGIC_64
+            raise ValueError(f"{os.path.basename(binary)} isn't a (little endian) mach-o binary")
+        start = pos = offset + (32 if magic == 0xfeedfacf else 28)
+        kept = []
+        for _ in range(ncmds):
+            cmd, cmdsize = struct.unpack_from("<II", data, pos)
+            name = None
+            if cmd in dylib_cmds:
+                name = data[pos + struct.unpack_from("<I", data, pos + 8)[0]:pos + cmdsize].split(b"\0")[0].decode()
+            if name not in names:
+                kept.append(data[pos:pos + cmdsize])
+            pos += cmdsize
+        new_cmds = b"".join(kept)
+        data[start:start + sizeofcmds] = new_cmds + bytes(sizeofcmds - len(new_cmds))
+        struct.pack_into("<II", data, offset + 16, len(kept), len(new_cmds))
+
+    with open(binary, "wb") as f:
+        f.write(data)
+
+
+@stage()
+async def extract_input():
+    global APP_PATH, PLIST_PATH, BINARY, BINARY_PATH, INPUT_SHA, INPUT_ZIP  # skipcq: PYL-W0603
+
+    # extracting ipa/copying app
+    if INPUT_IS_IPA:
+        try:
+            with ZipFile(args.i, "r") as ipa:
+                if not any(name.startswith("Payload/") for name in ipa.namelist()):
+                    raise KeyError
+                if INCREMENTAL:
+                    # everything else is extracted right before it's changed
+                    if args.a:
+                        print("[?] -q only extracts what it changes, so -a will be ignored")
+                    INPUT_ZIP = ZipFile(args.i, "r")
+                    for app in {name.split("/")[1] for name in ipa.namelist() if name.startswith("Payload/") and name.count("/") >= 2}:
+                        if app.endswith(".app"):
+                            os.makedirs(os.path.join(EXTRACT_DIR, "Payload", app))
+                elif args.a:
+                    await extract_cached(ipa)
+                else:
+                    print("[*] extracting ipa..")
+                    if args.q:
+                        await offload(ipa.extractall, EXTRACT_DIR)
+                    else:
+                        # hashed for the manifest at the same time as it is extracted, like the cache does
+                        INPUT_SHA, _ = await asyncio.gather(offload(hash_file, args.i), offload(ipa.extractall, EXTRACT_DIR))
+                    print("[*] extracted ipa")
+        except KeyError:
+            print("[!] couldn't find Payload folder, invalid ipa")
+            sys.exit(1)
+        except BadZipFile:
+            print("[!] not a zip/ipa file")
+            sys.exit(1)
+
+    # checking ipa/app validity
+    try:
+        if INPUT_IS_IPA:
+            APP_PATH = glob(os.path.join(EXTRACT_DIR, "Payload", "*.app"))[0]
+            await extract_item(os.path.join(APP_PATH, "Info.plist"))
+        else:
+            print("[*] copying app to temporary directory..")
+            if args.q:
+                await offload(copytree, args.i, os.path.join(EXTRACT_DIR, INPUT_BASENAME))
+            else:
+                INPUT_SHA, _ = await asyncio.gather(offload(hash_path, args.i), offload(copytree, args.i, os.path.join(EXTRACT_DIR, INPUT_BASENAME)))
+            print("[*] copied app")
+            APP_PATH = glob(os.path.join(EXTRACT_DIR, INPUT_BASENAME))[0]
+        PLIST_PATH = glob(os.path.join(APP_PATH, "Info.plist"))[0]
+        BINARY = get_plist(PLIST_PATH, "CFBundleExecutable")
+        if system == "Linux":
+            BINARY_PATH = os.path.join(APP_PATH, BINARY)
+        else:
+            BINARY_PATH = os.path.join(APP_PATH, BINARY).replace(" ", r"\ ")
+
+        # checking encryption status (when re-patching without extracting the binary, it was checked the first time)
+        if not INCREMENTAL and any("cryptid 1" in line for line in (await sh(f"otool -l '{BINARY_PATH}'", capture=True)).split("\n")):
+            print("[?] app is encrypted, the output app will only work for devices that have ever been logged in to your apple id")
+            print("[?] find a decrypted ipa for everything to function normally")
+    except IndexError:
+        print("[!] couldn't find .app folder and/or Info.plist file, invalid ipa/app specified")
+        sys.exit(1)
 
-    if any(i.endswith(".appex") for i in args.f):
-        os.makedirs(os.path.join(APP_PATH, "PlugIns"), exist_ok=True)
 
-    if any(i.endswith(known) for i in args.f for known in (".deb", ".dylib", ".framework")):
-        if inject_path:
-            os.makedirs(os.path.join(APP_PATH, "Frameworks"), exist_ok=True)
-            run(f"install_name_tool -add_rpath @executable_path/Frameworks {BINARY_PATH}", shell=True, stdout=DEVNULL, stderr=DEVNULL)   # skipcq: PYL-W1510
-        deb_counter = 0
+async def unpack_deb(deb, output):
+    os.makedirs(os.path.join(output, "e"))
+    if system == "Linux":
+        await sh(f"ar -x '{deb}' --output={output}")
+    else:
+        await sh(f"tar -xf '{deb}' -C {output}")
+    data_tar = glob(os.path.join(output, "data.*"))[0]
+    await sh(["tar", "-xf", data_tar, "-C", os.path.join(output, "e")])
+    print(f"[*] extracted {os.path.basename(deb)}")
 
-    common = (
-        "libmryipc.dylib", "librocketboostrap.dylib", "cydiasubstrate.framework",
-        "cephei.framework", "cepheiui.framework", "cepheiprefs.framework",
-        "substitute.framework", "libhdev.framework"
-    )
-    dylibs = {d for d in args.f if d.endswith(".dylib") and not any(com in d.lower() for com in common)}
-    id_injected = {f for f in args.f if ".framework" in f and not any(com in f.lower() for com in common)}
-    id_injected.update(dylibs)
+
+async def fix_dylib(dylib):
+    dylib_bn = os.path.basename(dylib)
+    actual_path = os.path.join(DYLIBS_PATH, dylib_bn)
+    try:
+        copyfile(dylib, actual_path)
+    except FileNotFoundError:
+        pass
+    await sh(f"ldid -S -M '{actual_path}'")
+    await sh(f"install_name_tool -id '{inject_path_exec}/{dylib_bn}' '{actual_path}'", stdout=DEVNULL, stderr=DEVNULL)
+    deps_temp = (await sh(f"otool -L '{actual_path}'", capture=True)).strip().split("\n")[2:]
+    for ind, dep in enumerate(deps_temp):
+        if "(architecture " in dep:
+            deps_temp = deps_temp[:ind]
+            break
+
+    deps = []
+    for dep in deps_temp:
+        if any(dep.startswith(s) for s in ("\t/Library/", "\t/usr/lib/", "\t@rpath", "\t@executable_path")):
+            deps.append(dep.split()[0])
+
+    for dep in deps_temp:
+        dep = dep.split()[0]
+
+        # check + fix dependencies on substrate, librocketbootstrap, libmryipc,
+        # cephei, cepheiui, and cepheiprefs.
+        for common_name, common_path in deps_info.items():
+            if common_name in dep.lower():
+                await sh(f"install_name_tool -change {dep} {inject_path_exec}/{common_path} '{actual_path}'", stdout=DEVNULL, stderr=DEVNULL)
+                needed.add(common_name)
+                if dep != f"{inject_path_exec}/{common_path}":
+                    print(f"[*] fixed dependency in {dylib_bn}: {dep} -> {inject_path_exec}/{common_path}")
+
+    for dep in deps:
+        for known in id_injected:
+            if os.path.basename(known) in dep:
+                bn = os.path.basename(dep)
+
+                if f"{inject_path_exec}/{bn}" in dep:
+                    continue
+
+                if dep.endswith(".dylib"):
+                    await sh(f"install_name_tool -change {dep} {inject_path_exec}/{bn} '{actual_path}'", stdout=DEVNULL, stderr=DEVNULL)
+                    print(f"[*] fixed dependency in {dylib_bn}: {dep} -> {inject_path_exec}/{bn}")
+                elif ".framework" in dep:
+                    await sh(f"install_name_tool -change {dep} {inject_path_exec}/{bn}.framework/{bn} '{actual_path}'", stdout=DEVNULL, stderr=DEVNULL)
+                    print(f"[*] fixed dependency in {dylib_bn}: {dep} -> {inject_path_exec}/{bn}.framework/{bn}")
+
+
+# tweaks are hashed for the manifest while they're being prepared. when re-patching,
+# the manifest decides which tweaks have to be prepared at all, so that happens first
+PLANNED = ("plan_tweaks",) if args.q else ()
+
+
+@stage()
+async def plan_tweaks():
+    global old_manifest  # skipcq: PYL-W0603
+    tweaks = list(args.f)  # debs add what they contain to args.f once they're unpacked
+    for tweak in tweaks:
+        origins[os.path.basename(tweak)] = os.path.basename(tweak)
+        manifest["tweaks"][os.path.basename(tweak)] = {"sha256": None, "items": {}, "load_commands": []}
+    for tweak, sha in zip(tweaks, await asyncio.gather(*(offload(hash_path, tweak) for tweak in tweaks))):
+        manifest["tweaks"][os.path.basename(tweak)]["sha256"] = sha
+
+    if not args.q:
+        return
+    old_manifest = await offload(read_manifest)
+    if old_manifest is None:
+        print(f"[!] couldn't find a pyzule manifest in {args.i}, it has to be patched normally")
+        sys.exit(1)
+    if (old_manifest["options"]["p"], old_manifest["options"]["t"]) != (args.p, args.t):
+        print("[!] -p and -t have to be the same as when the ipa was first patched")
+        sys.exit(1)
+    args.s = args.s or old_manifest["options"]["s"]  # anything newly injected has to be fakesigned too
+
+    removed = {os.path.basename(os.path.normpath(name)) for name in args.y or ()}
+    for name in sorted(removed):
+        if name in manifest["tweaks"]:
+            print(f"[!] {name} can't be injected and removed at the same time")
+            sys.exit(1)
+        if name not in old_manifest["tweaks"]:
+            print(f"[?] {name} wasn't injected by pyzule, so it can't be removed")
+
+    unchanged = set()
+    for name, tweak in old_manifest["tweaks"].items():
+        # old items might get removed, so don't compress them early. they can still be dependencies of updated tweaks
+        INJECTED.update(item.split("/")[0] for item in tweak["items"])
+        id_injected.update(os.path.basename(item) for item in tweak["items"] if item.endswith((".dylib", ".framework")))
+        if name not in manifest["tweaks"] and name not in removed:
+            manifest["tweaks"][name] = tweak  # not given again, so it's kept as it is
+        elif manifest["tweaks"].get(name, {}).get("sha256") == tweak["sha256"]:
+            manifest["tweaks"][name] = tweak
+            unchanged.add(name)
+            print(f"[*] {name} is unchanged, skipping it")
+    args.f = [f for f in args.f if os.path.basename(f) not in unchanged]
+    dylibs.difference_update({d for d in dylibs if os.path.basename(d) in unchanged})
+
+
+# tweaks don't need anything from the ipa, so they're prepared while it's being extracted
+@stage(*PLANNED)
+async def unpack_debs():
+    if not args.f:
+        return
+    os.makedirs(DYLIBS_PATH, exist_ok=True)
 
     # extracting all debs
-    for deb in set(args.f):
-        if not deb.endswith(".deb"):
-            continue
-        bn = os.path.basename(deb)
-        output = os.path.join(EXTRACT_DIR, str(deb_counter))
-        os.makedirs(output)
-        os.makedirs(os.path.join(output, "e"))
-        if system == "Linux":
-            run(f"ar -x '{deb}' --output={output}", shell=True, check=True)
-        else:
-            run(f"tar -xf '{deb}' -C {output}", shell=True, check=True)
-        data_tar = glob(os.path.join(output, "data.*"))[0]
-        run(["tar", "-xf", data_tar, "-C", os.path.join(output, "e")], check=True)
+    debs = [deb for deb in set(args.f) if deb.endswith(".deb")]
+    outputs = [os.path.join(EXTRACT_DIR, str(deb_counter)) for deb_counter in range(len(debs))]
+    await asyncio.gather(*(unpack_deb(deb, output) for deb, output in zip(debs, outputs)))
+
+    for deb, output in zip(debs, outputs):
         for dirpath, dirnames, filenames in os.walk(os.path.join(output, "e")):
             for filename in filenames:
                 if filename.endswith(".dylib") and not any(com in filename.lower() for com in common) and not os.path.islink(os.path.join(dirpath, filename)):
@@ -294,6 +944,7 @@ if args.f:
                     dest_path = os.path.join(DYLIBS_PATH, filename)
                     if not os.path.exists(dest_path):
                         move(src_path, dest_path)
+                    origins.setdefault(filename, os.path.basename(deb))
                     dylibs.add(filename)
                     id_injected.add(filename)
             for dirname in dirnames:
@@ -302,85 +953,119 @@ if args.f:
                     dest_path = os.path.join(DYLIBS_PATH, dirname)
                     if not os.path.exists(dest_path):
                         move(src_path, dest_path)
+                    origins.setdefault(dirname, os.path.basename(deb))
+                    INJECTED.add(dirname)
                     args.f.append(dirname)
                     if ".framework" in dirname:
                         id_injected.add(dirname)
                 if "preferenceloader" in dirname.lower():
                     print(f"[!] found dependency on PreferenceLoader in {deb}, ipa might not work jailed")
-        print(f"[*] extracted {bn}")
-        deb_counter += 1
 
     args.f = set(args.f)
-    needed = set()
-    deps_info = {
-        "substrate.": "CydiaSubstrate.framework/CydiaSubstrate",
-        "librocketbootstrap.": "librocketbootstrap.dylib",
-        "libmryipc.": "libmryipc.dylib",
-        "cephei.": "Cephei.framework/Cephei",
-        "cepheiui.": "CepheiUI.framework/CepheiUI",
-        "cepheiprefs.": "CepheiPrefs.framework/CepheiPrefs",
-        "libhdev.": "libhdev.framework/libhdev"
-    }
 
-    if args.t:
-        deps_info["substrate."] = "Substitute.framework/Substitute"
 
+@stage("unpack_debs")
+async def prepare_tweaks():
     # remove codesign + fix all dependencies
-    for dylib in dylibs:
-        dylib_bn = os.path.basename(dylib)
-        actual_path = os.path.join(DYLIBS_PATH, dylib_bn)
-        try:
-            copyfile(dylib, actual_path)
-        except FileNotFoundError:
-            pass
-        run(f"ldid -S -M '{actual_path}'", shell=True, check=True)
-        run(f"install_name_tool -id '{inject_path_exec}/{dylib_bn}' '{actual_path}'", shell=True, check=True, stdout=DEVNULL, stderr=DEVNULL)
-        deps_temp = run(f"otool -L '{actual_path}'", shell=True, capture_output=True, text=True, check=True).stdout.strip().split("\n")[2:]
-        for ind, dep in enumerate(deps_temp):
-            if "(architecture " in dep:
-                deps_temp = deps_temp[:ind]
-                break
+    await asyncio.gather(*(fix_dylib(dylib) for dylib in dylibs))
+
+
+# untouched files are compressed while everything else is still being modified.
+# debs have to be unpacked first, since whatever they add to the app root isn't an asset
+@stage("extract_input", "unpack_debs", *PLANNED)
+async def compress_assets():
+    global ZIP  # skipcq: PYL-W0603
+    if not OUTPUT_IS_IPA or args.z:
+        return
+    ZIP = ZipFile(OUTPUT_ZIP, "w", ZIP_DEFLATED, compresslevel=args.c)
+    if INCREMENTAL:
+        return  # the assets weren't extracted, they're copied from the input ipa at the end
+    _, files = await offload(payload_entries)
+    await compress_files([(path, arcname) for path, arcname in files if is_asset(path)])
+
+
+async def unsign_binary():
+    # only done once, right before the binary is first modified. re-patching often doesn't need to touch it
+    global HAS_ENTITLEMENTS  # skipcq: PYL-W0603
+    if HAS_ENTITLEMENTS is not None:
+        return
+    ENT_PATH = os.path.join(APP_PATH, 'pyzule.entitlements')
+    await extract_item(os.path.join(APP_PATH, BINARY))
+    await extract_item(ENT_PATH, keep=False)
+    try:
+        await sh(f"ldid -e {BINARY_PATH} > {ENT_PATH}", stderr=DEVNULL)
+        HAS_ENTITLEMENTS = 1 if os.path.getsize(ENT_PATH) > 0 else 0
+    except CalledProcessError:
+        with open(ENT_PATH, "w") as epf:
+            HAS_ENTITLEMENTS = 0
+        del epf
+    finally:
+        await sh(f"ldid -S {BINARY_PATH}")
+
+    if any(i.endswith(known) for i in args.f for known in (".deb", ".dylib", ".framework")) and inject_path:
+        await sh(f"install_name_tool -add_rpath @executable_path/Frameworks {BINARY_PATH}", check=False, stdout=DEVNULL, stderr=DEVNULL)
+
+
+def tweak_entry(name):
+    return manifest["tweaks"].setdefault(origins.get(name, name), {"sha256": None, "items": {}, "load_commands": []})
+
+
+async def needs_load_command(load_command, name):
+    tweak_entry(name)["load_commands"].append(load_command)
+    if old_manifest and any(load_command in tweak["load_commands"] for tweak in old_manifest["tweaks"].values()):
+        return False  # already in the binary from the last time it was patched
+    await unsign_binary()
+    return True
+
+
+async def is_unchanged(src, dest, name):
+    item = os.path.relpath(dest, APP_PATH)
+    if not args.q:
+        # only needed for the manifest, so injecting doesn't wait for it
+        hashing.append((tweak_entry(name)["items"], item, asyncio.ensure_future(offload(hash_path, src))))
+        touched.add(os.path.normpath(dest))
+        return False
+    sha = await offload(hash_path, src)
+    tweak_entry(name)["items"][item] = sha
+    if is_present(dest) and any(tweak["items"].get(item) == sha for tweak in old_manifest["tweaks"].values()):
+        print(f"[*] {name} is unchanged")
+        return True
+    await extract_item(dest, keep=False)
+    if os.path.isdir(dest) and not os.path.islink(dest):
+        await offload(rmtree, dest)  # so the new version can be copied over it
+    touched.add(os.path.normpath(dest))
+    return False
+
+
+@stage("extract_input", "plan_tweaks", "prepare_tweaks")
+async def inject_tweaks():
+    global changed  # skipcq: PYL-W0603
+
+    # remove app extensions
+    if args.e:
+        for name in ("PlugIns", "Extensions"):
+            await extract_item(os.path.join(APP_PATH, name), keep=False)
+        await offload(remove_dirs, APP_PATH, "app extensions", "PlugIns", "Extensions")
+
+    if not args.f and not old_manifest:
+        return
+    if not args.q:
+        await unsign_binary()
+
+    if any(i.endswith(".appex") for i in args.f):
+        os.makedirs(os.path.join(APP_PATH, "PlugIns"), exist_ok=True)
 
-        deps = []
-        for dep in deps_temp:
-            if any(dep.startswith(s) for s in ("\t/Library/", "\t/usr/lib/", "\t@rpath", "\t@executable_path")):
-                deps.append(dep.split()[0])
-
-        for dep in deps_temp:
-            dep = dep.split()[0]
-            dep_actual_path = os.path.join(APP_PATH, inject_path, os.path.basename(dep))
-
-            # check + fix dependencies on substrate, librocketbootstrap, libmryipc,
-            # cephei, cepheiui, and cepheiprefs.
-            for common_name, common_path in deps_info.items():
-                if common_name in dep.lower():
-                    run(f"install_name_tool -change {dep} {inject_path_exec}/{common_path} '{actual_path}'", shell=True, check=True, stdout=DEVNULL, stderr=DEVNULL)
-                    needed.add(common_name)
-                    if dep != f"{inject_path_exec}/{common_path}":
-                        print(f"[*] fixed dependency in {os.path.basename(dylib)}: {dep} -> {inject_path_exec}/{common_path}")
-
-        for dep in deps:
-            for known in id_injected:
-                if os.path.basename(known) in dep:
-                    bn = os.path.basename(dep)
-
-                    if f"{inject_path_exec}/{bn}" in dep:
-                        continue
-
-                    if dep.endswith(".dylib"):
-                        run(f"install_name_tool -change {dep} {inject_path_exec}/{bn} '{actual_path}'", shell=True, check=True, stdout=DEVNULL, stderr=DEVNULL)
-                        print(f"[*] fixed dependency in {os.path.basename(dylib)}: {dep} -> {inject_path_exec}/{bn}")
-                    elif ".framework" in dep:
-                        run(f"install_name_tool -change {dep} {inject_path_exec}/{bn}.framework/{bn} '{actual_path}'", shell=True, check=True, stdout=DEVNULL, stderr=DEVNULL)
-                        print(f"[*] fixed dependency in {os.path.basename(dylib)}: {dep} -> {inject_path_exec}/{bn}.framework/{bn}")
+    if any(i.endswith(known) for i in args.f for known in (".deb", ".dylib", ".framework")) and inject_path:
+        os.makedirs(os.path.join(APP_PATH, "Frameworks"), exist_ok=True)
 
     for missing in needed:
         real_dep_name = deps_info[missing].split("/")[0]
-        if not os.path.exists(os.path.join(APP_PATH, inject_path, real_dep_name)):
+        if not is_present(os.path.join(APP_PATH, inject_path, real_dep_name)):
             try:
-                copytree(os.path.join(USER_DIR, real_dep_name), os.path.join(APP_PATH, inject_path, real_dep_name))
+                await offload(copytree, os.path.join(USER_DIR, real_dep_name), os.path.join(APP_PATH, inject_path, real_dep_name))
             except NotADirectoryError:
                 copyfile(os.path.join(USER_DIR, real_dep_name), os.path.join(APP_PATH, inject_path, real_dep_name))
+            touched.add(os.path.normpath(os.path.join(APP_PATH, inject_path, real_dep_name)))
             print(f"[*] auto-injected {real_dep_name}")
         else:
             print(f"[*] existing {real_dep_name} found")
@@ -391,33 +1076,41 @@ if args.f:
     if "librocketbootstrap." in needed and "substrate." not in needed:
         if args.p or not args.t:
             if args.p:
-                run("install_name_tool -change @rpath/CydiaSubstrate.framework/CydiaSubstrate " +
+                await extract_item(os.path.join(APP_PATH, "librocketbootstrap.dylib"))
+                await sh("install_name_tool -change @rpath/CydiaSubstrate.framework/CydiaSubstrate " +
                 f"@executable_path/CydiaSubstrate.framework/CydiaSubstrate '{os.path.join(APP_PATH, inject_path)}/librocketbootstrap.dylib'",
-                shell=True, check=True, stdout=DEVNULL, stderr=DEVNULL)  # is this how im supposed to do it?
+                stdout=DEVNULL, stderr=DEVNULL)  # is this how im supposed to do it?
                 print("[*] fixed dependency in librocketbootstrap.dylib: @rpath/CydiaSubstrate.framework/CydiaSubstrate -> @executable_path/CydiaSubstrate.framework/CydiaSubstrate")
-            if os.path.exists(os.path.join(APP_PATH, inject_path, "CydiaSubstrate.framework")):
+            if is_present(os.path.join(APP_PATH, inject_path, "CydiaSubstrate.framework")):
                 print("[*] existing CydiaSubstrate.framework found, replacing")
+                await extract_item(os.path.join(APP_PATH, inject_path, "CydiaSubstrate.framework"), keep=False)
                 rmtree(os.path.join(APP_PATH, inject_path, "CydiaSubstrate.framework"))
 
-            copytree(os.path.join(USER_DIR, "CydiaSubstrate.framework"), os.path.join(APP_PATH, inject_path, "CydiaSubstrate.framework"))
+            await offload(copytree, os.path.join(USER_DIR, "CydiaSubstrate.framework"), os.path.join(APP_PATH, inject_path, "CydiaSubstrate.framework"))
+            touched.add(os.path.normpath(os.path.join(APP_PATH, inject_path, "CydiaSubstrate.framework")))
             print("[*] auto-injected CydiaSubstrate.framework")
         elif args.t:
-            run("install_name_tool -change @rpath/CydiaSubstrate.framework/CydiaSubstrate " +
+            await sh("install_name_tool -change @rpath/CydiaSubstrate.framework/CydiaSubstrate " +
             f"@rpath/Substitute.framework/Substitute '{os.path.join(APP_PATH, inject_path)}/librocketbootstrap.dylib'",
-            shell=True, check=True, stdout=DEVNULL, stderr=DEVNULL)  # repeating code? whaaat? nooo!!!
+            stdout=DEVNULL, stderr=DEVNULL)  # repeating code? whaaat? nooo!!!
             print("[*] fixed dependency in librocketbootstrap.dylib: @rpath/CydiaSubstrate.framework/CydiaSubstrate -> @rpath/Substitute.framework/Substitute")
 
-            if os.path.exists(os.path.join(APP_PATH, inject_path, "Substitute.framework")):
+            if is_present(os.path.join(APP_PATH, inject_path, "Substitute.framework")):
                 print("[*] existing Substitute.framework found, replacing")
+                await extract_item(os.path.join(APP_PATH, inject_path, "Substitute.framework"), keep=False)
                 rmtree(os.path.join(APP_PATH, inject_path, "Substitute.framework"))
 
-            copytree(os.path.join(USER_DIR, "Substitute.framework"), os.path.join(APP_PATH, inject_path, "Substitute.framework"))
+            await offload(copytree, os.path.join(USER_DIR, "Substitute.framework"), os.path.join(APP_PATH, inject_path, "Substitute.framework"))
+            touched.add(os.path.normpath(os.path.join(APP_PATH, inject_path, "Substitute.framework")))
             print("[*] auto-injected Substitute.framework")
 
     for d in dylibs:
         actual_path = os.path.join(DYLIBS_PATH, os.path.basename(d))
         bn = os.path.basename(d)
-        run(f"insert_dylib --inplace --no-strip-codesig --weak --all-yes '{inject_path_exec}/{bn}' '{BINARY_PATH}'", shell=True, stdout=DEVNULL, check=True)
+        if await needs_load_command(f"{inject_path_exec}/{bn}", bn):
+            await sh(f"insert_dylib --inplace --no-strip-codesig --weak --all-yes '{inject_path_exec}/{bn}' '{BINARY_PATH}'", stdout=DEVNULL)
+        if await is_unchanged(actual_path, os.path.join(APP_PATH, inject_path, bn), bn):
+            continue
         if os.path.exists(os.path.join(APP_PATH, inject_path, bn)):
             print(f"[*] existing {bn} found, replaced")
             os.remove(os.path.join(APP_PATH, inject_path, bn))
@@ -428,223 +1121,338 @@ if args.f:
     for tweak in args.f:
         bn = os.path.basename(tweak)
         actual_path = os.path.join(DYLIBS_PATH, os.path.basename(tweak))
+        src = tweak if os.path.exists(tweak) else actual_path
         try:
             if bn.endswith(".framework") and "cydiasubstrate" not in bn.lower():
-                try:
-                    copytree(tweak, os.path.join(APP_PATH, inject_path, bn))
-                    framework_exec = get_plist(os.path.join(tweak, "Info.plist"), "CFBundleExecutable")
-                except FileNotFoundError:
-                    copytree(actual_path, os.path.join(APP_PATH, inject_path, bn))
-                    framework_exec = get_plist(os.path.join(actual_path, "Info.plist"), "CFBundleExecutable")
-                run(f"insert_dylib --inplace --no-strip-codesig --weak --all-yes {inject_path_exec}/{bn}/{framework_exec} {BINARY_PATH}", shell=True, stdout=DEVNULL, check=True)
-                print(f"[*] injected {bn}")
+                framework_exec = get_plist(os.path.join(src, "Info.plist"), "CFBundleExecutable")
+                if not await is_unchanged(src, os.path.join(APP_PATH, inject_path, bn), bn):
+                    await offload(copytree, src, os.path.join(APP_PATH, inject_path, bn))
+                    print(f"[*] injected {bn}")
+                if await needs_load_command(f"{inject_path_exec}/{bn}/{framework_exec}", bn):
+                    await sh(f"insert_dylib --inplace --no-strip-codesig --weak --all-yes {inject_path_exec}/{bn}/{framework_exec} {BINARY_PATH}", stdout=DEVNULL)
             elif bn.endswith(".appex"):
-                copytree(tweak, os.path.join(APP_PATH, "PlugIns", bn))
+                if await is_unchanged(src, os.path.join(APP_PATH, "PlugIns", bn), bn):
+                    continue
+                await offload(copytree, tweak, os.path.join(APP_PATH, "PlugIns", bn))
                 print(f"[*] copied {bn} to PlugIns")
             elif (
                 tweak not in dylibs and not bn.endswith(".deb") and "cydiasubstrate" not in tweak.lower()
                 and not any(com in tweak for com in common)
             ):
+                if await is_unchanged(src, os.path.join(APP_PATH, bn), bn):
+                    continue
                 try:
                     if os.path.isdir(tweak):
-                        copytree(tweak, os.path.join(APP_PATH, bn))
+                        await offload(copytree, tweak, os.path.join(APP_PATH, bn))
                     else:
                         copyfile(tweak, os.path.join(APP_PATH, bn))
                 except FileNotFoundError:
                     if os.path.isdir(actual_path):
-                        copytree(actual_path, os.path.join(APP_PATH, bn))
+                        await offload(copytree, actual_path, os.path.join(APP_PATH, bn))
                     else:
                         copyfile(actual_path, os.path.join(APP_PATH, bn))
                 print(f"[*] copied {bn} to app root")
         except FileExistsError:
             continue
 
+    # remove whatever updated (or no longer used) tweaks left behind
+    if old_manifest:
+        items = {item for tweak in manifest["tweaks"].values() for item in tweak["items"]}
+        load_commands = {lc for tweak in manifest["tweaks"].values() for lc in tweak["load_commands"]}
+        stale = set()
+        for name, tweak in old_manifest["tweaks"].items():
+            if manifest["tweaks"].get(name) is tweak:
+                continue
+            for item in tweak["items"]:
+                if item not in items and is_present(item_path := os.path.join(APP_PATH, item)):
+                    await extract_item(item_path, keep=False)
+                    if os.path.isdir(item_path) and not os.path.islink(item_path):
+                        await offload(rmtree, item_path)
+                    else:
+                        os.remove(item_path)
+                    touched.add(os.path.normpath(item_path))
+                    print(f"[*] removed {os.path.basename(item)}")
+            stale.update(lc for lc in tweak["load_commands"] if lc not in load_commands)
+        if stale:
+            await unsign_binary()
+            try:
+                await offload(remove_load_commands, os.path.join(APP_PATH, BINARY), stale)
+            except (ValueError, struct.error) as e:
+                print(f"[!] couldn't remove load commands: {e}")
+                sys.exit(1)
+            print("[*] removed load commands:", ", ".join(sorted(stale)))
+
     if HAS_ENTITLEMENTS:
-        run(f"ldid -S'{ENT_PATH}' {BINARY_PATH}", shell=True, check=True)
+        await sh(f"ldid -S'{os.path.join(APP_PATH, 'pyzule.entitlements')}' {BINARY_PATH}")
         print("[*] restored app entitlements")
-    changed = 1
+    if not args.q or touched or HAS_ENTITLEMENTS is not None:
+        changed = 1
 
-plist = get_plist(PLIST_PATH)
 
-# removing UISupportedDevices (if specified)
-if args.u:
-    try:
-        del plist["UISupportedDevices"]
-        print("[*] removed UISupportedDevices")
+@stage("inject_tweaks")
+async def modify_plist():
+    global changed  # skipcq: PYL-W0603
+    plist = get_plist(PLIST_PATH)
+
+    # removing UISupportedDevices (if specified)
+    if args.u:
+        try:
+            del plist["UISupportedDevices"]
+            print("[*] removed UISupportedDevices")
+            changed = 1
+        except KeyError:
+            print("[?] UISupportedDevices not present")
+
+    # removing watch app (if specified)
+    if args.w:
+        for name in ("Watch", "WatchKit", "com.apple.WatchPlaceholder"):
+            await extract_item(os.path.join(APP_PATH, name), keep=False)
+        await offload(remove_dirs, APP_PATH, "watch app", "Watch", "WatchKit", "com.apple.WatchPlaceholder")
+
+    # set minimum os version (if specified)
+    if args.m:
+        change_plist(f"set MinimumOSVersion to {args.m}", f"MinimumOSVersion was already {args.m}",
+                    plist, args.m, "MinimumOSVersion")
+
+    # enable documents support
+    if args.d:
+        change_plist("enabled documents support", "documents support was already enabled",
+                    plist, True, "UISupportsDocumentBrowser", "UIFileSharingEnabled")
+
+    # change app name
+    if args.n:
+        change_plist(f"changed app name to {args.n}", f"app name was already {args.n}",
+                    plist, args.n, "CFBundleDisplayName", "CFBundleName")
+
+    # change app version
+    if args.v:
+        change_plist(f"changed app version to {args.v}", f"app version was already {args.v}",
+                    plist, args.v, "CFBundleShortVersionString", "CFBundleVersion")
+
+    # change app bundle id
+    if args.b:
+        orig_bundle = plist["CFBundleIdentifier"]
+        plist["CFBundleIdentifier"] = args.b
+        print(f"[*] changed bundle id: {orig_bundle} -> {args.b}")
+        for ext in input_glob(os.path.join("PlugIns", "*.appex")):
+            await extract_item(os.path.join(ext, "Info.plist"))
+        for ext in (PLUGINS := glob(os.path.join(APP_PATH, "PlugIns", "*.appex"))):
+            appex_plist = get_plist((ext_plist := os.path.join(ext, "Info.plist")))
+            appex_plist["CFBundleIdentifier"] = appex_plist["CFBundleIdentifier"].replace(orig_bundle, args.b)
+            dump_plist(ext_plist, appex_plist)
+        if PLUGINS:
+            print("[*] changed all other bundle ids")
         changed = 1
-    except KeyError:
-        print("[?] UISupportedDevices not present")
-
-# removing watch app (if specified)
-if args.w:
-    remove_dirs(APP_PATH, "watch app", "Watch", "WatchKit", "com.apple.WatchPlaceholder")
-
-# set minimum os version (if specified)
-if args.m:
-    change_plist(f"set MinimumOSVersion to {args.m}", f"MinimumOSVersion was already {args.m}",
-                plist, args.m, "MinimumOSVersion")
-
-# enable documents support
-if args.d:
-    change_plist("enabled documents support", "documents support was already enabled",
-                plist, True, "UISupportsDocumentBrowser", "UIFileSharingEnabled")
-
-# change app name
-if args.n:
-    change_plist(f"changed app name to {args.n}", f"app name was already {args.n}",
-                plist, args.n, "CFBundleDisplayName", "CFBundleName")
-
-# change app version
-if args.v:
-    change_plist(f"changed app version to {args.v}", f"app version was already {args.v}",
-                plist, args.v, "CFBundleShortVersionString", "CFBundleVersion")
-
-# change app bundle id
-if args.b:
-    orig_bundle = plist["CFBundleIdentifier"]
-    plist["CFBundleIdentifier"] = args.b
-    print(f"[*] changed bundle id: {orig_bundle} -> {args.b}")
-    for ext in (PLUGINS := glob(os.path.join(APP_PATH, "PlugIns", "*.appex"))):
-        appex_plist = get_plist((ext_plist := os.path.join(ext, "Info.plist")))
-        appex_plist["CFBundleIdentifier"] = appex_plist["CFBundleIdentifier"].replace(orig_bundle, args.b)
-        dump_plist(ext_plist, appex_plist)
-    if PLUGINS:
-        print("[*] changed all other bundle ids")
-    changed = 1
-
-# add url schemes to the app
-if args.r:
-    SCHEMES = [scheme.replace("://", "") for scheme in args.r]
-    if "CFBundleURLTypes" not in plist:
-        plist["CFBundleURLTypes"] = []
-    plist["CFBundleURLTypes"].append({
-        "CFBundleURLName": "fyi.zxcvbn.pyzule",
-        "CFBundleURLSchemes": SCHEMES
-    })
-    print("[*] added url schemes:", ", ".join(SCHEMES))
-    changed = 1
-
-# "merge" plist content
-# if theres stuff like arrays, this will just replace them instead of actually merging them
-# why? because im lazy. and im 90% sure no one cares. if i (or someone else) needs it, i'll fix it
-if args.l:
-    args.l = os.path.normpath(args.l)  # skipcq: FLK-E741
-    try:
-        with open(args.l, "rb") as m:
-            merge = load(m)
-        not_new = []
-        for k, v in merge.items():
-            if k in plist and plist[k] == v:
-                not_new.append(k)
-            plist[k] = v
-        if len(not_new) == len(merge):
-            print("[?] no modified plist entries")
+
+    # add url schemes to the app
+    if args.r:
+        SCHEMES = [scheme.replace("://", "") for scheme in args.r]
+        if "CFBundleURLTypes" not in plist:
+            plist["CFBundleURLTypes"] = []
+        plist["CFBundleURLTypes"].append({
+            "CFBundleURLName": "fyi.zxcvbn.pyzule",
+            "CFBundleURLSchemes": SCHEMES
+        })
+        print("[*] added url schemes:", ", ".join(SCHEMES))
+        changed = 1
+
+    # "merge" plist content
+    # if theres stuff like arrays, this will just replace them instead of actually merging them
+    # why? because im lazy. and im 90% sure no one cares. if i (or someone else) needs it, i'll fix it
+    if args.l:
+        args.l = os.path.normpath(args.l)  # skipcq: FLK-E741
+        try:
+            with open(args.l, "rb") as m:
+                merge = load(m)
+            not_new = []
+            for k, v in merge.items():
+                if k in plist and plist[k] == v:
+                    not_new.append(k)
+                plist[k] = v
+            if len(not_new) == len(merge):
+                print("[?] no modified plist entries")
+            else:
+                print("[*] merged plist, modified keys:", ", ".join(k for k in merge.keys() if k not in not_new))
+                changed = 1
+        except Exception:  # skipcq: PYL-W0703 -- let's just hope this catches any parsing errors.
+            print("[!] couldn't parse plist")
+
+    # change app icon - makes a new icon name, should hopefully
+    # force it to use the new icon instead of the one in cache
+    if args.k:
+        args.k = os.path.normpath(args.k)
+        IMG_PATH = os.path.join(EXTRACT_DIR, "pyzule_img.png")
+
+        # convert to png
+        if not args.k.endswith(".png"):
+            with Image.open(args.k) as img:
+                img.save(IMG_PATH, "PNG")
         else:
-            print("[*] merged plist, modified keys:", ", ".join(k for k in merge.keys() if k not in not_new))
-            changed = 1
-    except Exception:  # skipcq: PYL-W0703 -- let's just hope this catches any parsing errors.
-        print("[!] couldn't parse plist")
-
-# change app icon - makes a new icon name, should hopefully
-# force it to use the new icon instead of the one in cache
-if args.k:
-    args.k = os.path.normpath(args.k)
-    IMG_PATH = os.path.join(EXTRACT_DIR, "pyzule_img.png")
-
-    # convert to png
-    if not args.k.endswith(".png"):
-        with Image.open(args.k) as img:
-            img.save(IMG_PATH, "PNG")
-    else:
-        copyfile(args.k, IMG_PATH)
-
-    icon = f"pyzule_{int(time())}_"
-    icon_60x60 = f"{icon}60x60"
-    icon_76x76 = f"{icon}76x76"
-    with Image.open(IMG_PATH) as img:
-        img.resize((120, 120)).save(os.path.join(APP_PATH, f"{icon_60x60}@2x.png"), "PNG")
-        img.resize((152, 152)).save(os.path.join(APP_PATH, f"{icon_76x76}@2x~ipad.png"), "PNG")
-
-    plist["CFBundleIcons"] = {
-        "CFBundlePrimaryIcon": {
-            "CFBundleIconFiles": [icon_60x60],
-            "CFBundleIconName": icon
+            copyfile(args.k, IMG_PATH)
+
+        icon = f"pyzule_{int(time())}_"
+        icon_60x60 = f"{icon}60x60"
+        icon_76x76 = f"{icon}76x76"
+        with Image.open(IMG_PATH) as img:
+            img.resize((120, 120)).save(os.path.join(APP_PATH, f"{icon_60x60}@2x.png"), "PNG")
+            img.resize((152, 152)).save(os.path.join(APP_PATH, f"{icon_76x76}@2x~ipad.png"), "PNG")
+
+        plist["CFBundleIcons"] = {
+            "CFBundlePrimaryIcon": {
+                "CFBundleIconFiles": [icon_60x60],
+                "CFBundleIconName": icon
+            }
         }
-    }
-    plist["CFBundleIcons~ipad"] = {
-        "CFBundlePrimaryIcon": {
-            "CFBundleIconFiles": [icon_60x60, icon_76x76],
-            "CFBundleIconName": icon
+        plist["CFBundleIcons~ipad"] = {
+            "CFBundlePrimaryIcon": {
+                "CFBundleIconFiles": [icon_60x60, icon_76x76],
+                "CFBundleIconName": icon
+            }
         }
-    }
 
-    print("[*] updated app icon")
-    changed = 1
+        print("[*] updated app icon")
+        changed = 1
 
-dump_plist(PLIST_PATH, plist)
+    dump_plist(PLIST_PATH, plist)
+
+
+@stage("modify_plist")
+async def sign_app():
+    global changed  # skipcq: PYL-W0603
+
+    if args.s:
+        PATTERNS = (
+            "*.dylib", "*.framework",
+            os.path.join("PlugIns", "*.appex"),
+            os.path.join("Extensions", "*.appex"),
+            os.path.join("Frameworks", "*.dylib"),
+            os.path.join("Frameworks", "*.framework")
+        )
+        sign_binary = 1
+        if args.q and old_manifest["options"]["s"]:
+            # when re-patching, only what actually changed has to be signed again
+            tfs = [fs for fs in sum((glob(os.path.join(APP_PATH, p)) for p in PATTERNS), []) if os.path.normpath(fs) in touched]
+            sign_binary = 1 if HAS_ENTITLEMENTS is not None else 0
+        else:
+            for fs in [os.path.join(APP_PATH, BINARY)] + sum((input_glob(p) for p in PATTERNS), []):
+                await extract_item(fs)
+            tfs = sum((glob(os.path.join(APP_PATH, p)) for p in PATTERNS), [])
+
+        if sign_binary or tfs:
+            print("[*] fakesigning..")
+            if sign_binary:
+                await sh(f"ldid -S -M {BINARY_PATH}")
+            for ind, fs in enumerate(tfs):
+                if any(s in fs for s in (".framework", ".appex")):
+                    FS_EXEC = get_plist(os.path.join(fs, "Info.plist"), "CFBundleExecutable")
+                    tfs[ind] = os.path.join(fs, FS_EXEC)
+            await asyncio.gather(*(sh(f"ldid -S -M '{fs}'") for fs in tfs))
+            print(f"[*] fakesigned \033[1m{len(tfs) + sign_binary}\033[0m items")
+            changed = 1
 
-if args.s:
-    print("[*] fakesigning..")
-    run(f"ldid -S -M {BINARY_PATH}", shell=True, check=True)
-    fs_counter = 1
+    # sign app executable with entitlements provided
+    if args.x:
+        await extract_item(os.path.join(APP_PATH, BINARY))
+        try:
+            await sh(f"ldid -S'{os.path.normpath(args.x)}' {BINARY_PATH}")
+            print("[*] signed binary with entitlements file")
+            changed = 1
+        except CalledProcessError:
+            print("[!] couldn't sign binary with entitlements")
 
-    PATTERNS = (
-        "*.dylib", "*.framework",
-        os.path.join("PlugIns", "*.appex"),
-        os.path.join("Extensions", "*.appex"),
-        os.path.join("Frameworks", "*.dylib"),
-        os.path.join("Frameworks", "*.framework")
-    )
-    tfs = sum((glob(os.path.join(APP_PATH, p)) for p in PATTERNS), [])
+    # checking if anything was actually changed
+    if not changed:
+        print("[!] nothing was changed, output will not be created")
+        sys.exit()
 
-    for fs in tfs:
-        if any(s in fs for s in (".framework", ".appex")):
-            FS_EXEC = get_plist(os.path.join(fs, "Info.plist"), "CFBundleExecutable")
-            run(f"ldid -S -M '{os.path.join(fs, FS_EXEC)}'", shell=True, check=True)
-        else:
-            run(f"ldid -S -M '{fs}'", shell=True, check=True)
-        fs_counter += 1
-    print(f"[*] fakesigned \033[1m{fs_counter}\033[0m items")
-    changed = 1
 
-# sign app executable with entitlements provided
-if args.x:
-    try:
-        run(f"ldid -S'{os.path.normpath(args.x)}' {BINARY_PATH}", shell=True, check=True)
-        print("[*] signed binary with entitlements file")
-        changed = 1
-    except CalledProcessError:
-        print("[!] couldn't sign binary with entitlements")
+@stage("sign_app")
+async def write_manifest():
+    options = {opt: getattr(args, opt) for opt in ("n", "v", "b", "m", "r", "u", "w", "d", "s", "e", "p", "t")}
+    options.update({opt: hash_file(getattr(args, opt)) if getattr(args, opt) else None for opt in ("k", "x", "l")})
+    dependencies = {deps_info[dep].split("/")[0] for dep in needed}
+    for items, item, task in hashing:
+        items[item] = await task
+
+    if old_manifest:
+        options = {**old_manifest["options"], **{opt: value for opt, value in options.items() if value}}
+        dependencies.update(old_manifest["dependencies"])
+        patched_from = old_manifest["input"]
+    else:
+        patched_from = {"name": INPUT_BASENAME, "sha256": INPUT_SHA}
+
+    with open(os.path.join(APP_PATH, MANIFEST), "w") as f:
+        json.dump({
+            "input": patched_from,
+            "options": options,
+            "tweaks": manifest["tweaks"],
+            "dependencies": sorted(dependencies)
+        }, f, indent=2)
 
-# checking if anything was actually changed
-if not changed:
-    print("[!] nothing was changed, output will not be created")
-    sys.exit()
 
 # zipping everything back into an ipa/app
-os.chdir(EXTRACT_DIR)
-if OUTPUT_IS_IPA:
+@stage("compress_assets", "write_manifest")
+async def generate_output():
+    global ZIP  # skipcq: PYL-W0603
+    if not OUTPUT_IS_IPA:
+        print("[*] moving app to output..")
+        return
+
     if args.z:
         print("[*] generating ipa using 7z..")
-    else:
-        print(f"[*] generating ipa using compression level {args.c}..")
-    if not INPUT_IS_IPA:
-        os.makedirs("Payload")
-        run(f"mv '{INPUT_BASENAME}' 'Payload/{INPUT_BASENAME}'", shell=True, check=True)
-    if args.z:
-        run(f"7z a '{os.path.basename(args.o)}' Payload", shell=True, check=True)
+        if not INPUT_IS_IPA:
+            os.makedirs(os.path.join(EXTRACT_DIR, "Payload"))
+            await sh(f"mv '{INPUT_BASENAME}' 'Payload/{INPUT_BASENAME}'", cwd=EXTRACT_DIR)
+        await sh(f"7z a '{os.path.basename(args.o)}' Payload", cwd=EXTRACT_DIR)
         print()  # just need a new line!
-    else:
-        run(f"zip -{args.c} -r '{os.path.basename(args.o)}' Payload", shell=True, stdout=DEVNULL, check=True)
-else:
-    print("[*] moving app to output..")
+        return
+
+    print(f"[*] generating ipa using compression level {args.c}..")
+    loop = asyncio.get_running_loop()
+    dirs, files = await offload(payload_entries)
+    current = {arcname: path for path, arcname in files}
+
+    def is_stale(arcname):
+        try:
+            st = os.stat(current[arcname])
+        except (KeyError, FileNotFoundError):
+            return True
+        return WRITTEN[arcname] != (st.st_size, st.st_mtime_ns, st.st_ino)
+
+    if any(is_stale(arcname) for arcname in WRITTEN):
+        print("[?] some files changed after they were compressed, compressing everything again..")
+        await loop.run_in_executor(WRITER, ZIP.close)
+        ZIP = ZipFile(OUTPUT_ZIP, "w", ZIP_DEFLATED, compresslevel=args.c)
+        WRITTEN.clear()
+
+    for path, arcname in dirs:
+        await loop.run_in_executor(WRITER, ZIP.writestr, ZipInfo.from_file(path, arcname, strict_timestamps=False), b"")
+    if INCREMENTAL:
+        # everything that wasn't extracted (or written over) is still the same as in the input ipa
+        on_disk = {arcname for _, arcname in dirs + files}
+        await loop.run_in_executor(WRITER, copy_entries, ZIP, [
+            info for info in INPUT_ZIP.infolist()
+            if not is_extracted(name := info.filename.rstrip("/")) and name not in on_disk
+        ])
+    await compress_files([(path, arcname) for path, arcname in files if arcname not in WRITTEN])
+    await loop.run_in_executor(WRITER, ZIP.close)
+
+
+async def main():
+    global LIMITER  # skipcq: PYL-W0603
+    LIMITER = asyncio.Semaphore(args.j)  # limits how many subprocesses run at once
+    return await run_stages()
+
+
+os.makedirs(EXTRACT_DIR)
+if (error := asyncio.run(main())) is not None:
+    raise error
 
 # cleanup when everything is done
-os.chdir(WORKING_DIR)
 if "/" in args.o:
     os.makedirs(args.o.replace(os.path.basename(args.o), ""), exist_ok=True)
 if OUTPUT_IS_IPA:
-    move(os.path.join(EXTRACT_DIR, os.path.basename(args.o)), args.o)
+    move(OUTPUT_ZIP, args.o)
     print(f"[*] generated ipa at {args.o}")
 else:
     run(f"mv '{APP_PATH}' '{os.path.join(EXTRACT_DIR, os.path.basename(args.o))}'", shell=True, stderr=DEVNULL)  # skipcq: PYL-W1510